@@ -1,14 +1,15 @@
 """DynagRPC Python abstraction library over gRPC and protobuf types."""
 from __future__ import annotations
 
+import ast
 from collections.abc import Callable
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial, wraps
+from functools import lru_cache, partial, wraps
 from importlib import import_module
 from inspect import signature
-from itertools import groupby
 from operator import attrgetter
-import re
+import sys
+import threading
 import warnings
 
 from google.protobuf.descriptor import (
@@ -41,6 +42,7 @@ __all__ = [
     "snake2pascal",
     "pascal2snake",
     "create_enum_dict",
+    "create_enum_dicts",
     "GrpcTypeCastRegistry",
     "GrpcServiceBase",
     "GrpcServer",
@@ -81,72 +83,205 @@ class DynaGrpcWarning(Warning):
 
 
 class AttrDict(dict):
+    __slots__ = ()  # No instance __dict__, attributes are the items
     __getattr__ = dict.__getitem__
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
 
 
+class _Record:
+    """Base for the message record classes, created on registration."""
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__
+        )
+
+
+class _ClassRegistry(dict):
+    """
+    Cache of a registry keyed by the descriptor full name of messages,
+    accessed by the message class instead, which is cheaper to get
+    from a message than its descriptor full name.
+    """
+
+    def __init__(self, getter: Callable[[str], Callable]):
+        super().__init__()
+        self.getter = getter  # Get a converter from a full name
+
+    def __missing__(self, message_cls: type[Message]) -> Callable:
+        converter = self.getter(message_cls.DESCRIPTOR.full_name)
+        self[message_cls] = converter
+        return converter
+
+
+def _identity(value):
+    return value
+
+
+_VALUE_GETTER = attrgetter("value")  # Wrapper message to Python
+
+
+class _NotImplementedCaster:
+    """Caster that always fails, for types not yet implemented."""
+    __slots__ = ("_msg",)
+
+    def __init__(self, error_message: str):
+        self._msg = error_message
+
+    def __call__(self, unused_input):
+        raise NotImplementedError(self._msg)
+
+
+_GOOGLE_PROTOBUF_NOT_IMPLEMENTED = {  # Types registered as failures
+    sys.intern("google.protobuf." + name)
+    for name in (
+        "ListValue", "Struct", "Value",  # struct.proto
+        "Any",  # any.proto
+        "Duration",  # duration.proto
+        "FieldMask",  # field_mask.proto
+        "Timestamp",  # timestamp.proto
+    )
+}
+
+
+# Largest AST (in nodes) of a nested message cast that gets inlined,
+# bigger ones call the nested message converter instead, as otherwise
+# the generated code would grow exponentially with the nesting depth
+_INLINE_MAX_NODES = 200
+
+
+@lru_cache(maxsize=None)  # Type names are a small finite set
 def snake2pascal(name: str) -> str:
     """Convert snake_case to PascalCase (a.k.a. UpperCamelCase)."""
     return "".join(map(str.title, name.split("_")))
 
 
+@lru_cache(maxsize=None)
 def pascal2snake(name: str) -> str:
     """Convert PascalCase to snake_case."""
-    return "_".join(
-        ("" if length == 1 else "_").join(group).lower()
-        for length, group in groupby(re.findall("[A-Z][^A-Z]*", name), len)
-    )
-
-
-def create_enum_dict(
+    # Each word starts with an ASCII uppercase letter (any leading char
+    # before it is ignored), and words are joined by underscores,
+    # except for consecutive single-letter words (e.g. acronyms)
+    chars = []
+    size = 0  # Length of the current word
+    after_letter = False  # Whether the current word follows a letter
+    for char in name:
+        if "A" <= char <= "Z":
+            if size > 1:
+                chars.append("_")
+            after_letter = size == 1
+            size = 1
+            chars.append(char)
+        elif size:
+            if size == 1 and after_letter:
+                chars.insert(-1, "_")
+            size += 1
+            chars.append(char)
+    return "".join(chars).lower()
+
+
+def create_enum_dicts(
     enum_type: EnumDescriptor,
-    mode: Literal["int2str", "str2int"],
     prefix: str | None = None,
-) -> dict[int, str] | dict[str, int]:
+) -> tuple[dict[int, str], dict[str, int]]:
     """
-    Dictionary representing a protobuf enum assuming no alias,
-    already removing the common prefix if it's following the convention
-    of using the enum name in ``UPPER_CASE_`` as the prefix.
+    Pair of ``(int2str, str2int)`` dictionaries representing a protobuf
+    enum assuming no alias, already removing the common prefix if it's
+    following the convention of using the enum name in ``UPPER_CASE_``
+    as the prefix.
 
     Parameters
     ----------
     enum_type :
         Enum type from the ``service_pb2`` (or ``GrpcServer._protos``)
-        to be converted to a mapping.
-    mode :
-        Whether the result should cast integer enum codes to strings
-        (``int2str``) or vice-versa (``str2int``).
+        to be converted to mappings.
     prefix :
         Custom prefix to be removed, use an empty string to force it to
         don't cut prefixes; ``None`` (default) means it should attempt
         to use the upper ``snake_case`` of the enum type name with a
         trailing underscore (``_``).
     """
-    common = prefix
     if prefix is None:
         common = pascal2snake(enum_type.name).upper() + "_"
+        strict = False
     else:
         common = prefix
-    if all(value.name.startswith(common) for value in enum_type.values):
-        threshold = len(common)
-    elif prefix is not None:
-        raise ValueError(f"The {prefix!r} prefix is not common for all values")
-    else:
+        strict = True
+
+    # Optimistically strip the prefix while building the dictionaries,
+    # as it's the usual case, validating it in the same loop
+    size = len(common)
+    if size:
+        int2str = {}
+        str2int = {}
+        for value in enum_type.values:
+            name = value.name
+            if name[:size] != common:
+                break
+            short = name[size:]
+            int2str[value.number] = short
+            str2int[short] = value.number
+        else:
+            return int2str, str2int
+
+        if strict:
+            raise ValueError(
+                f"The {prefix!r} prefix is not common for all values",
+            )
         warnings.warn(
             f"Missing values prefix in enum {enum_type.full_name}",
             DynaGrpcWarning,
         )
-        threshold = 0
+
+    # Without a prefix to remove, there's no need for slicing names
+    int2str = {value.number: value.name for value in enum_type.values}
+    str2int = {value.name: value.number for value in enum_type.values}
+    return int2str, str2int
+
+
+def create_enum_dict(
+    enum_type: EnumDescriptor,
+    mode: Literal["int2str", "str2int"],
+    prefix: str | None = None,
+) -> dict[int, str] | dict[str, int]:
+    """
+    Dictionary representing a protobuf enum, see ``create_enum_dicts``
+    for the details.
+
+    Parameters
+    ----------
+    enum_type :
+        Enum type from the ``service_pb2`` (or ``GrpcServer._protos``)
+        to be converted to a mapping.
+    mode :
+        Whether the result should cast integer enum codes to strings
+        (``int2str``) or vice-versa (``str2int``).
+    prefix :
+        Custom prefix to be removed, as in ``create_enum_dicts``.
+    """
     if mode == "int2str":
-        pairs = enum_type.values_by_number.items()
-        return {number: value.name[threshold:] for number, value in pairs}
+        return create_enum_dicts(enum_type, prefix)[0]
     if mode == "str2int":
-        pairs = enum_type.values_by_name.items()
-        return {name[threshold:]: value.number for name, value in pairs}
+        return create_enum_dicts(enum_type, prefix)[1]
     raise ValueError(f"Unknown mode {mode!r}")
 
 
+# Enum dicts are shared by all registries, as they're never mutated,
+# and the descriptors live as long as their pool (usually forever)
+_cached_enum_dicts = lru_cache(maxsize=None)(create_enum_dicts)
+
+
 class GrpcTypeCastRegistry:
     """
     Registry of callables and dictionaries intended for representing
@@ -154,11 +289,21 @@ class GrpcTypeCastRegistry:
     objects and gRPC-specific protobuf messages or fields.
     """
 
-    def __init__(self, dict_cls: type[dict] = AttrDict):
+    def __init__(self, dict_cls: type[dict] | None = AttrDict):
+        """
+        Parameters
+        ----------
+        dict_cls :
+            Dictionary class of the messages cast to Python objects.
+            When ``None``, messages are cast to instances of record
+            classes with ``__slots__``, created for each message type.
+        """
         # Registry names expected by the AST-generated lambda functions
-        # Keys for the registries are always the "descriptor" full name
+        # Keys for the registries are always the "descriptor" full name,
+        # interned to match the constants in the generated functions
         self._namespace = AttrDict(
             d=dict_cls,  # Dict wrapper for all messages
+            r={},  # Record classes registry (used when dict_cls is None)
             m2p={},  # Message to Python (usually dict) registry
             p2m={},  # Python to protobuf message registry
             f2p={},  # Field to Python registry
@@ -167,125 +312,364 @@ class GrpcTypeCastRegistry:
             s2i={},  # Enum registry, str to int
             c={},  # Message constructors registry
         )  # Note: _namespace is not intended to be accessed directly!
-        self._registering = set()
-        self._register_google_types()
+        self._m2p_by_cls = _ClassRegistry(
+            partial(self._get_converter, self._namespace.m2p),
+        )
+        self._p2m_by_cls = _ClassRegistry(
+            partial(self._get_converter, self._namespace.p2m),
+        )
+        self._not_inlined = set()  # (Registry name, full name) too big
+        self._pending_defs = []  # Function ASTs not yet compiled
+        self._pending_keys = []  # Their (registry name, full name) pairs
+        self._bound_items = {}  # Bound names of (registry name, full name)
+        self._lock = threading.RLock()  # Registering while casting
+
+        # Register the NullValue enum from struct.proto, other special
+        # google.protobuf.* types are registered only when required
+        self._namespace.i2s["google.protobuf.NullValue"] = {0: None}
+        self._namespace.s2i["google.protobuf.NullValue"] = {None: 0}
 
-    def _register_google_types(self) -> None:
+    def _defer_function(
+        self,
+        regname: str,
+        full_name: str,
+        return_ast: ast.AST,
+        arg_name: str,
+    ) -> None:
         """
-        Register ``google.protobuf.*`` types that behave differently
-        than custom protobuf-defined types.
+        Store the AST of a single-argument function to be compiled
+        and registered only when flushing, all at once.
+        The registries and registry items it uses are bound as
+        keyword-only arguments, which are faster to access than global
+        names (and items don't require a lookup at all).
         """
-        # Register the NullValue enum from struct.proto
-        self._namespace.i2s["google.protobuf.NullValue"] = {0: None}
-        self._namespace.s2i["google.protobuf.NullValue"] = {None: 0}
+        func_name = f"{regname}_{len(self._pending_defs)}_" + (
+            full_name.replace(".", "_")
+        )
+        used_names = _astcast.loaded_names(return_ast)
+        bound = {
+            name: ast.Name(name, ctx=ast.Load())
+            for name in self._namespace if name in used_names
+        }
+        for name in sorted(used_names.intersection(self._bound_items)):
+            bound[name] = _astcast.registry_item_ast(*self._bound_items[name])
+        self._pending_defs.append(_astcast.function_def_ast(
+            name=func_name,
+            return_ast=return_ast,
+            arg_name=arg_name,
+            bound=bound,
+        ))
+        self._pending_keys.append((regname, sys.intern(full_name)))
+
+    def _bound_item_ast(self, regname: str, full_name: str) -> ast.AST:
+        """
+        AST for the name of a registry item (e.g. a constructor) to be
+        bound in the deferred functions, whose value is the item itself,
+        which should be registered before flushing.
+        """
+        key = regname, full_name
+        name = f"_{regname}_" + full_name.replace(".", "_")
+        while self._bound_items.setdefault(name, key) != key:
+            name += "_"  # Avoid clashes like "a_b.c" VS "a.b_c"
+        return ast.Name(name, ctx=ast.Load())
+
+    def flush(self) -> None:
+        """
+        Compile all the pending functions at once, registering them.
+        This is called automatically at the end of a registration.
+        """
+        with self._lock:
+            if not self._pending_defs:
+                return  # Nothing to do
+            function_asts, self._pending_defs = self._pending_defs, []
+            keys, self._pending_keys = self._pending_keys, []
+            functions = _astcast.create_functions(
+                function_asts=function_asts,
+                file_name="<dynagrpc>",
+                namespace=self._namespace,
+            )
+            for (regname, full_name), func in zip(keys, functions):
+                self._namespace[regname][full_name] = func
 
-        # Register all wrapped scalars from wrappers.proto
-        for full_name, wrapper in _astcast.GOOGLE_PROTOBUF_WRAPPERS.items():
+    def _register_google_type(self, full_name: str) -> bool:
+        """
+        Register the given ``google.protobuf.*`` message type if it's
+        one of the types that behave differently than custom
+        protobuf-defined types, returning whether it's one of them.
+        """
+        wrapper = _astcast.GOOGLE_PROTOBUF_WRAPPERS.get(full_name)
+        if wrapper is not None:  # Wrapped scalar from wrappers.proto
             self._namespace.c[full_name] = wrapper
-            self._namespace.m2p[full_name] = attrgetter("value")
-            self._namespace.p2m[full_name] = _astcast.create_lambda(
+            self._namespace.m2p[full_name] = _VALUE_GETTER
+            self._defer_function(
+                regname="p2m",
+                full_name=full_name,
                 return_ast=_astcast.wrapper2message_ast(
-                    full_name=full_name,
+                    constructor_ast=self._bound_item_ast("c", full_name),
                     value_name="arg",
-                    constructors_regname="c",
                 ),
                 arg_name="arg",
-                file_name=f"<p2m/{full_name}>",
-                namespace=self._namespace,
             )
+            return True
 
         # Register a failure for these not yet implemented types
-        def fail(error_message, unused_input):
-            raise NotImplementedError(error_message)
-
-        for name in (
-            "ListValue", "Struct", "Value",  # struct.proto
-            "Any",  # any.proto
-            "Duration",  # duration.proto
-            "FieldMask",  # field_mask.proto
-            "Timestamp",  # timestamp.proto
-        ):
-            full_name = "google.protobuf." + name
-            named_fail = partial(fail, full_name)
+        if full_name in _GOOGLE_PROTOBUF_NOT_IMPLEMENTED:
+            named_fail = _NotImplementedCaster(full_name)
             self._namespace.m2p[full_name] = named_fail
             self._namespace.p2m[full_name] = named_fail
+            return True
+
+        return False
+
+    def _get_converter(
+        self,
+        registry: dict[str, Callable],
+        full_name: str,
+    ) -> Callable:
+        """
+        Get the converter from the registry, registering it first
+        if it's from a special ``google.protobuf.*`` message type.
+        """
+        if full_name not in registry:
+            with self._lock:  # Check again, it might be registered now
+                if (full_name not in registry
+                        and self._register_google_type(full_name)):
+                    self.flush()
+        return registry[full_name]
 
     def register_enum_type(self, enum_type: EnumDescriptor) -> None:
-        full_name = enum_type.full_name
-        self._namespace.i2s[full_name] = create_enum_dict(enum_type, "int2str")
-        self._namespace.s2i[full_name] = create_enum_dict(enum_type, "str2int")
+        full_name = sys.intern(enum_type.full_name)
+        int2str, str2int = _cached_enum_dicts(enum_type)
+        self._namespace.i2s[full_name] = int2str
+        self._namespace.s2i[full_name] = str2int
 
     def register_message_type(self, message_type: Descriptor) -> None:
-        full_name = message_type.full_name
+        with self._lock:
+            self._register_message_dfs(
+                message_type, visiting=set(), done=set(),
+            )
+            self.flush()
+
+    def _register_message_dfs(
+        self,
+        message_type: Descriptor,
+        visiting: set[int],
+        done: set[int],
+    ) -> None:
+        """
+        Register the message type and, in a depth-first search, all the
+        message types of its fields, where ``visiting`` has the ``id``
+        of the descriptors being registered and ``done`` has the ones
+        already registered in the current search.
+        """
+        key = id(message_type)
+        if key in done or key in visiting:
+            return  # Nothing to do (or a reference cycle)
+        full_name = sys.intern(message_type.full_name)
 
         # Prevent overwriting messages (e.g. google wrappers)
-        if full_name in self._namespace.m2p:
+        if (full_name in self._namespace.m2p
+                or self._register_google_type(full_name)):
             return  # Nothing to do
 
-        self._registering.add(message_type)  # Prevent reentrant deadlock
-        try:
-            # Create a lambda to cast a protobuf message to a custom dict
-            self._namespace.m2p[full_name] = _astcast.create_lambda(
-                return_ast=_astcast.wrap_call_ast(
-                    callable_name="d",
-                    input_ast=_astcast.message2dict_ast(
-                        message_type=message_type,
-                        value_name="msg",
-                        enum_registry=self._namespace.i2s,
-                        field_regname="f2p",
-                    ),
-                ),
-                arg_name="msg",
-                file_name=f"<m2p/{full_name}>",
-                namespace=self._namespace,
-            )
+        visiting.add(key)
 
-            # Create a lambda to cast a dict to protobuf message
-            self._namespace.p2m[full_name] = _astcast.create_lambda(
-                return_ast=_astcast.dict2message_ast(
-                    message_type=message_type,
-                    value_name="data",
-                    constructors_regname="c",
-                    field_regname="p2f",
-                ),
-                arg_name="data",
-                file_name=f"<p2m/{full_name}>",
-                namespace=self._namespace,
+        # Register the message and enum types of the fields first,
+        # but not the fields themselves, as their casts get inlined
+        for field in message_type.fields:
+            self._register_field_types_dfs(field, visiting, done)
+
+        # Create a function to cast a protobuf message to a custom dict
+        self._defer_function(
+            regname="m2p",
+            full_name=full_name,
+            return_ast=self._message2dict_ast(message_type, "msg", visiting),
+            arg_name="msg",
+        )
+
+        # Create a function to cast a dict to protobuf message
+        self._defer_function(
+            regname="p2m",
+            full_name=full_name,
+            return_ast=self._dict2message_ast(message_type, "data", visiting),
+            arg_name="data",
+        )
+
+        if self._namespace.d is None:
+            field_names = [
+                field.name for field in
+                sorted(message_type.fields, key=attrgetter("number"))
+            ]
+            self._namespace.r[full_name] = _astcast.create_record_class(
+                class_name=message_type.name,
+                field_names=field_names,
+                base=_Record,
+                file_name=f"<r/{full_name}>",
             )
 
-            # Populate self._namespace.f2p and self._namespace.p2f
-            for field in message_type.fields:
-                self.register_field_type(field)
+        # Unfortunately, the constructor of the message is private,
+        # but accessing it is more straightforward than looking for
+        # its underlying Python module
+        self._namespace.c[full_name] = message_type._concrete_class
 
-            # Unfortunately, the constructor of the message is private,
-            # but accessing it is more straightforward than looking for
-            # its underlying Python module
-            self._namespace.c[full_name] = message_type._concrete_class
-        finally:
-            self._registering.remove(message_type)
+        visiting.discard(key)
+        done.add(key)
+
+    def _inline_cast_ast(
+        self,
+        ast_builder: Callable[[Descriptor, str, set[int]], ast.AST],
+        regname: str,
+        visiting: set[int],
+        message_type: Descriptor,
+        value_name: str,
+    ) -> ast.AST:
+        """
+        AST to cast a nested message by inlining the AST created by the
+        given builder, or calling the message converter from the
+        registry for the special ``google.protobuf.*`` message types,
+        for the ones that would otherwise be inlined recursively
+        and for the ones whose inlined AST would be too big.
+        """
+        key = id(message_type)
+        full_name = message_type.full_name
+        if (key in visiting or (regname, full_name) in self._not_inlined
+                or full_name.startswith("google.protobuf.")):
+            return _astcast.message_cast_ast(regname, message_type, value_name)
+        visiting.add(key)  # Prevent infinite inlining
+        result = ast_builder(message_type, value_name, visiting)
+        visiting.discard(key)
+        if sum(1 for unused in ast.walk(result)) > _INLINE_MAX_NODES:
+            self._not_inlined.add((regname, full_name))  # Don't build again
+            return _astcast.message_cast_ast(regname, message_type, value_name)
+        return result
+
+    def _message2dict_ast(
+        self,
+        message_type: Descriptor,
+        value_name: str,
+        visiting: set[int],
+    ) -> ast.AST:
+        """
+        AST to cast a message to a custom dict (or to a record),
+        inlining its fields.
+        """
+        caster = partial(
+            self._inline_cast_ast, self._message2dict_ast, "m2p", visiting,
+        )
+        field_asts = {
+            field.full_name: _astcast.field_cast_ast(
+                msg_regname="m2p",
+                enum_regname="i2s",
+                field=field,
+                value_name="value",
+                message_caster=caster,
+                item_getter=self._bound_item_ast,
+            )
+            for field in message_type.fields
+        }
+        if self._namespace.d is None:
+            return _astcast.message2record_ast(
+                message_type=message_type,
+                value_name=value_name,
+                enum_registry=self._namespace.i2s,
+                field_asts=field_asts,
+                record_ast=self._bound_item_ast("r", message_type.full_name),
+                field_value_name="value",
+            )
+        dict_ast = _astcast.message2dict_ast(
+            message_type=message_type,
+            value_name=value_name,
+            enum_registry=self._namespace.i2s,
+            field_asts=field_asts,
+            field_value_name="value",
+        )
+        if self._namespace.d is dict:
+            return dict_ast  # The literal is already the result, no copy
+        return _astcast.wrap_call_ast(callable_name="d", input_ast=dict_ast)
+
+    def _dict2message_ast(
+        self,
+        message_type: Descriptor,
+        value_name: str,
+        visiting: set[int],
+    ) -> ast.AST:
+        """AST to cast a dict to a message, inlining its fields."""
+        caster = partial(
+            self._inline_cast_ast, self._dict2message_ast, "p2m", visiting,
+        )
+        field_asts = {
+            field.full_name: _astcast.field_cast_ast(
+                msg_regname="p2m",
+                enum_regname="s2i",
+                field=field,
+                value_name="value",
+                message_caster=caster,
+                item_getter=self._bound_item_ast,
+            )
+            for field in message_type.fields
+            if _astcast.is_nesting_field(field)
+        }
+        return _astcast.dict2message_ast(
+            message_type=message_type,
+            value_name=value_name,
+            constructor_ast=self._bound_item_ast("c", message_type.full_name),
+            field_asts=field_asts,
+        )
 
     def register_field_type(self, field: FieldDescriptor) -> None:
-        # Ensure all message types are registered
-        mt = field.message_type
-        if mt and not (mt.GetOptions().map_entry or mt in self._registering):
-            self.register_message_type(mt)
-
-        # Create lambdas to cast the field to/from Python
-        for registry, msg_regname, enum_regname in (
-            (self._namespace.f2p, "m2p", "i2s"),
-            (self._namespace.p2f, "p2m", "s2i"),
+        with self._lock:
+            self._register_field_types_dfs(field, visiting=set(), done=set())
+            self._defer_field_functions(field)
+            self.flush()
+
+    def _defer_field_functions(self, field: FieldDescriptor) -> None:
+        """
+        Create functions to cast the field to/from Python,
+        sharing a single function for all fields that need no cast
+        (e.g. scalars) instead of compiling one for each of them.
+        """
+        for regname, msg_regname, enum_regname in (
+            ("f2p", "m2p", "i2s"),
+            ("p2f", "p2m", "s2i"),
         ):
-            registry[field.full_name] = _astcast.create_lambda(
-                return_ast=_astcast.field_cast_ast(
-                    msg_regname=msg_regname,
-                    enum_regname=enum_regname,
-                    field=field,
-                    value_name="value",
-                ),
-                arg_name="value",
-                file_name=f"<{msg_regname}/{field.full_name}>",
-                namespace=self._namespace,
+            cast_ast = _astcast.field_cast_ast(
+                msg_regname=msg_regname,
+                enum_regname=enum_regname,
+                field=field,
+                value_name="value",
+                item_getter=self._bound_item_ast,
             )
+            if _astcast.is_identity_ast(cast_ast, "value"):
+                full_name = sys.intern(field.full_name)
+                self._namespace[regname][full_name] = _identity
+            else:
+                self._defer_function(
+                    regname=regname,
+                    full_name=field.full_name,
+                    return_ast=cast_ast,
+                    arg_name="value",
+                )
+
+    def _register_field_types_dfs(
+        self,
+        field: FieldDescriptor,
+        visiting: set[int],
+        done: set[int],
+    ) -> None:
+        """
+        Register the message and enum types of the field, including
+        the ones from the values of a ``map<key, value>``, in the same
+        depth-first search, as in ``_register_message_dfs``.
+        """
+        if field.message_type and field.message_type.GetOptions().map_entry:
+            field_type = field.message_type.fields_by_name["value"]
+        else:
+            field_type = field
+        if field_type.message_type:
+            self._register_message_dfs(field_type.message_type, visiting, done)
+        enum_type = field_type.enum_type
+        if enum_type and enum_type.full_name not in self._namespace.i2s:
+            self.register_enum_type(enum_type)
 
     def proto2py(
         self,
@@ -293,7 +677,8 @@ class GrpcTypeCastRegistry:
     ) -> dict | str | int | bool | float | bytes:
         """
         Convert a gRPC-specific protobuf message to a Python object,
-        generally an instance of the given ``dict_cls`` (a dictionary).
+        generally an instance of the given ``dict_cls`` (a dictionary),
+        or of a record class when ``dict_cls`` is ``None``.
 
         Though not based on the proto3 JSON spec, this converter is an
         alternative to ``google.protobuf.json_format.MessageToDict``.
@@ -301,7 +686,9 @@ class GrpcTypeCastRegistry:
         highlighted:
 
         - Result is a dictionary, not a custom object, unless the
-          message type is a special ``google.protobuf.*`` one.
+          message type is a special ``google.protobuf.*`` one, or
+          ``dict_cls`` is ``None``, where it's a record whose
+          attributes are the fields (comparable like dictionaries).
         - Items in the result keep the protobuf message number order.
         - The resulting dictionary has attribute access to its items,
           as long as it doesn't clash with dictionary methods.
@@ -320,11 +707,32 @@ class GrpcTypeCastRegistry:
           and unlike any JSON-based alternative for other key types
           like ``bool`` or ``bytes``.
         """
-        return self._namespace.m2p[message.DESCRIPTOR.full_name](message)
+        return self._m2p_by_cls[type(message)](message)
 
     def py2proto(self, message_cls: type[Message], data: dict) -> Message:
         """Convert a dictionary to a gRPC-specific protobuf message."""
-        return self._namespace.p2m[message_cls.DESCRIPTOR.full_name](data)
+        return self._p2m_by_cls[message_cls](data)
+
+    def get_proto2py(
+        self,
+        message_cls: type[Message],
+    ) -> Callable[[Message], dict | str | int | bool | float | bytes]:
+        """
+        Get the converter that ``proto2py`` would call for messages
+        of the given class, for callers that convert the same message
+        type repeatedly and shouldn't pay for the dispatch every time.
+        """
+        return self._m2p_by_cls[message_cls]
+
+    def get_py2proto(
+        self,
+        message_cls: type[Message],
+    ) -> Callable[[dict], Message]:
+        """
+        Get the converter that ``py2proto`` would call
+        for the given message class.
+        """
+        return self._p2m_by_cls[message_cls]
 
 
 class GrpcServiceBase:
@@ -479,6 +887,7 @@ class GrpcServer(GrpcServiceBase):
             input_msg_name = request_name or command_name + "Request"
             request_cls = getattr(self._protos, input_msg_name)
             input_names = {rdf.name for rdf in request_cls.DESCRIPTOR.fields}
+            request_to_kwargs = self.typecast.get_proto2py(request_cls)
             sig = signature(func)
             sig_params = set(sig.parameters)
             missing_names = input_names - sig_params
@@ -493,7 +902,7 @@ class GrpcServer(GrpcServiceBase):
             output_msg_name = response_name or command_name + "Response"
             response_cls = getattr(self._protos, output_msg_name)
             output_names = [rdf.name for rdf in response_cls.DESCRIPTOR.fields]
-            dict_to_resp = partial(self.typecast.py2proto, response_cls)
+            dict_to_resp = self.typecast.get_py2proto(response_cls)
             type_map = {
                 dict: dict_to_resp,
                 tuple: lambda data: dict_to_resp(
@@ -520,7 +929,7 @@ class GrpcServer(GrpcServiceBase):
 
             @wraps(func)  # Can't keep signature, but can keep __wrapped__ ref
             def wrapper(request, context):
-                kwargs = self.typecast.proto2py(request)
+                kwargs = request_to_kwargs(request)
                 if keep_request:
                     kwargs["request"] = request
                 if keep_context:
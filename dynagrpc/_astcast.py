@@ -8,8 +8,10 @@ from __future__ import annotations
 
 import ast
 from collections.abc import Callable
+from copy import deepcopy
 from functools import partial
 from operator import attrgetter
+import sys
 from typing import Any
 
 from google.protobuf import wrappers_pb2
@@ -20,31 +22,168 @@ from google.protobuf.descriptor import (
 )
 
 
-def create_lambda(
+def function_def_ast(
+    name: str,
     return_ast: ast.AST,
     arg_name: str = "value",
+    bound: dict[str, ast.AST] | None = None,
+) -> ast.FunctionDef:
+    """
+    AST for the definition of a single-argument function with the
+    chosen name and argument name, whose returning body is the given
+    AST. The bound names are keyword-only arguments defaulting to the
+    given ASTs, evaluated once when defining the function, so that
+    they're seen as locals.
+    """
+    # Since ast.arguments changed in Python 3.8, use what's available
+    func_ast = ast.parse("def tmp(tmp): return tmp").body[0]
+    func_ast.name = name
+    func_ast.args.args[0].arg = arg_name
+    if bound:
+        func_ast.args.kwonlyargs = [
+            ast.arg(bound_name, annotation=None) for bound_name in bound
+        ]
+        func_ast.args.kw_defaults = list(bound.values())
+    func_ast.body[0].value = return_ast
+    return func_ast
+
+
+def create_functions(
+    function_asts: list[ast.FunctionDef],
     file_name: str = "<unknown>",
     namespace: dict[str, Any] | None = None,
     optimize: int = 2,
-) -> Callable:
-    """
-    Create a single-argument lambda function with the chosen argument
-    name and whose returning body is the given AST, exposing to its
-    lexical scope only the given namespace.
-    """
-    # Since ast.Lambda changed in Python 3.8, use what's available
-    func_ast = ast.parse("lambda tmp: tmp", mode="eval")
-    func_ast.body.args.args[0].arg = arg_name
-    func_ast.body.body = return_ast
-    return eval(
-        compile(  # JIT creating the lambda function
-            source=ast.fix_missing_locations(func_ast),
+) -> list[Callable]:
+    """
+    Create all functions from their definition ASTs compiling them
+    at once, exposing to their lexical scope only the given namespace.
+    """
+    namespace = {} if namespace is None else namespace
+    module_ast = ast.parse("")
+    module_ast.body.extend(function_asts)
+    exec(
+        compile(  # JIT creating all the functions
+            source=ast.fix_missing_locations(module_ast),
             filename=file_name,
-            mode="eval",
+            mode="exec",
             optimize=optimize,
         ),
         namespace,
     )
+    return [namespace.pop(func_ast.name) for func_ast in function_asts]
+
+
+def create_record_class(
+    class_name: str,
+    field_names: list[str],
+    base: type = object,
+    file_name: str = "<unknown>",
+    optimize: int = 2,
+) -> type:
+    """
+    Create a class whose ``__slots__`` are the given field names,
+    with an ``__init__`` method that gets all fields as positional
+    arguments in the same order.
+    """
+    init_ast = ast.parse("def __init__(self): pass").body[0]
+    args = [f"_{index}" for index in range(len(field_names))]
+    init_ast.args.args.extend(ast.arg(arg, annotation=None) for arg in args)
+    init_ast.body = [  # self.field_name = _index
+        ast.Assign(
+            targets=[ast.Attribute(
+                value=ast.Name("self", ctx=ast.Load()),
+                attr=field_name,
+                ctx=ast.Store(),
+            )],
+            value=ast.Name(arg, ctx=ast.Load()),
+        )
+        for field_name, arg in zip(field_names, args)
+    ] or [ast.Pass()]
+    init, = create_functions([init_ast], file_name, optimize=optimize)
+    return type(class_name, (base,), {
+        "__slots__": tuple(field_names),
+        "__init__": init,
+    })
+
+
+class NameSplicer(ast.NodeTransformer):
+    """
+    Replace every loaded ``name`` by the given AST node, using the node
+    itself in its first occurrence and a copy of it in the other ones.
+    """
+
+    def __init__(self, name: str, node: ast.AST):
+        self.name = name
+        self.node = node
+        self.spliced = False
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id == self.name and isinstance(node.ctx, ast.Load):
+            if self.spliced:  # E.g. the enum cast dict.get(value, value)
+                return deepcopy(self.node)
+            self.spliced = True
+            return self.node
+        return node
+
+
+def loaded_names(tree: ast.AST) -> set[str]:
+    """Set of all variable names loaded in the given AST."""
+    return {
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+
+
+def is_identity_ast(tree: ast.AST, value_name: str) -> bool:
+    """Check if the AST is just the ``value`` variable, as is."""
+    return isinstance(tree, ast.Name) and tree.id == value_name
+
+
+def splice_ast(tree: ast.AST, name: str, node: ast.AST) -> ast.AST:
+    """
+    Splice the ``node`` AST into the given ``tree`` AST in place of
+    all occurrences of the ``name`` variable. The ``node`` itself goes
+    in the first occurrence, so it shouldn't be used anywhere else.
+    """
+    return NameSplicer(name, node).visit(tree)
+
+
+def registry_item_ast(registry_name: str, key: str) -> ast.AST:
+    """
+    AST for ``registry[key]`` with the ``key`` string interned, so that
+    the constant in the compiled code is the very same object as the
+    (also interned) registry key, for faster dictionary lookups.
+    """
+    return subscript_ast(
+        ast.Name(registry_name, ctx=ast.Load()),
+        ast.Constant(sys.intern(key)),
+    )
+
+
+def subscript_ast(value_ast: ast.AST, key_ast: ast.AST) -> ast.AST:
+    """AST for ``value[key]``, loading an item."""
+    if sys.version_info < (3, 9):  # The key used to be wrapped
+        key_ast = ast.Index(key_ast)
+    return ast.Subscript(value=value_ast, slice=key_ast, ctx=ast.Load())
+
+
+def call_ast(
+    func_ast: ast.AST,
+    args: list[ast.AST],
+    keywords: dict[str | None, ast.AST] | None = None,
+) -> ast.AST:
+    """
+    AST for ``func(*args, **keywords)``, where a ``None`` keyword
+    unpacks its value, like ``func(**value)``.
+    """
+    return ast.Call(
+        func=func_ast,
+        args=args,
+        keywords=[
+            ast.keyword(arg=arg, value=value_ast)
+            for arg, value_ast in (keywords or {}).items()
+        ],
+    )
 
 
 def get_field_descriptor_map(prefix: str) -> dict[int, str]:
@@ -70,14 +209,23 @@ def enum_cast_ast(
     registry_name: str,
     enum_type: EnumDescriptor,
     value_name: str,
+    item_getter: Callable[[str, str], ast.AST] = registry_item_ast,
 ) -> ast.AST:
     """
     AST for ``registry[enum_name].get(value, value)``, assuming the
-    registry is a dictionary of dictionaries representing enums.
+    registry is a dictionary of dictionaries representing enums,
+    where the ``registry[enum_name]`` AST is created by the
+    ``item_getter`` from the registry name and the enum name.
     """
-    full_name = enum_type.full_name
-    source = f"{registry_name}[{full_name!r}].get({value_name}, {value_name})"
-    return ast.parse(source, mode="eval").body
+    get_ast = ast.Attribute(
+        value=item_getter(registry_name, enum_type.full_name),
+        attr="get",
+        ctx=ast.Load(),
+    )
+    return call_ast(get_ast, [
+        ast.Name(value_name, ctx=ast.Load()),
+        ast.Name(value_name, ctx=ast.Load()),
+    ])
 
 
 def message_cast_ast(
@@ -89,8 +237,10 @@ def message_cast_ast(
     AST for ``registry[message_name](value)``, assuming the registry is
     a dictionary of message converters (callables).
     """
-    python_code = f"{registry_name}[{message_type.full_name!r}]({value_name})"
-    return ast.parse(python_code, mode="eval").body
+    return call_ast(
+        registry_item_ast(registry_name, message_type.full_name),
+        [ast.Name(value_name, ctx=ast.Load())],
+    )
 
 
 def label_caster_wrap_ast(
@@ -116,12 +266,21 @@ def field_cast_ast(
     enum_regname: str,
     field: FieldDescriptor,
     value_name: str,
+    message_caster: Callable[[Descriptor, str], ast.AST] | None = None,
+    item_getter: Callable[[str, str], ast.AST] = registry_item_ast,
 ) -> ast.AST:
     """
     AST to cast a ``value`` between protobuf and Python representations
     of the given fields, assuming two dicts for registry are available
     in lexical scope, whose names are given as parameters.
+    Nested messages are cast by the ``message_caster``, a callable that
+    gets the message type and the value name to create the AST,
+    which defaults to a call to the message registry.
+    Enums are cast by the dictionary whose AST is created by the
+    ``item_getter`` (see ``enum_cast_ast``).
     """
+    if message_caster is None:
+        message_caster = partial(message_cast_ast, msg_regname)
     ctype = CPPTYPE_MAP[field.cpp_type]
     if ctype in CPPTYPE_SCALARS:  # Python objects even when repeated
         return ast.Name(value_name, ctx=ast.Load())
@@ -129,7 +288,12 @@ def field_cast_ast(
     if ctype == "ENUM":
         return label_caster_wrap_ast(
             label=LABEL_MAP[field.label],
-            caster=partial(enum_cast_ast, enum_regname, field.enum_type),
+            caster=partial(
+                enum_cast_ast,
+                enum_regname,
+                field.enum_type,
+                item_getter=item_getter,
+            ),
             value_name=value_name,
         )
 
@@ -149,18 +313,31 @@ def field_cast_ast(
                 "{k: nest_tmp for k, v in value_tmp.items()}",
                 mode="eval",
             ).body  # *_tmp are replaced below, in order
-            dict_comp_ast.value = field_cast_ast(
-                msg_regname=msg_regname,
-                enum_regname=enum_regname,
-                field=value_type,
-                value_name="v",
-            )
+            if value_ctype == "MESSAGE":  # Bound to "v", like repeated ones
+                dict_comp_ast.value = message_caster(
+                    value_type.message_type, "v",
+                )
+            else:
+                dict_comp_ast.value = field_cast_ast(
+                    msg_regname=msg_regname,
+                    enum_regname=enum_regname,
+                    field=value_type,
+                    value_name="v",
+                    message_caster=message_caster,
+                    item_getter=item_getter,
+                )
             dict_comp_ast.generators[0].iter.func.value.id = value_name
             return dict_comp_ast
 
+        # Only a repeated (or map) message value is bound to a variable
+        # name, a singular one is called as inlining it would repeat
+        # the value expression (e.g. msg.field) for each of its fields
+        label = LABEL_MAP[field.label]
+        if label != "REPEATED":
+            message_caster = partial(message_cast_ast, msg_regname)
         return label_caster_wrap_ast(
-            label=LABEL_MAP[field.label],
-            caster=partial(message_cast_ast, msg_regname, field.message_type),
+            label=label,
+            caster=partial(message_caster, field.message_type),
             value_name=value_name,
         )
 
@@ -198,7 +375,8 @@ def message2dict_ast(
     message_type: Descriptor,
     value_name: str,
     enum_registry: dict[str, dict[int, str | None]],
-    field_regname: str,
+    field_asts: dict[str, ast.AST],
+    field_value_name: str = "value",
 ) -> ast.AST:
     """
     AST to cast a ``value`` message to a Python dictionary.
@@ -211,35 +389,141 @@ def message2dict_ast(
         Name of the ``value`` variable as seen in AST lexical scope.
     enum_registry :
         Registry of enums represented as "int to str" dictionaries.
-    field_regname :
-        Name of the registry of "field to Python" converters as seen
-        in the AST lexical scope.
+    field_asts :
+        Mapping of field full names to their "field to Python" cast
+        AST, which gets spliced in place of the field value.
+    field_value_name :
+        Name of the field value variable in the ``field_asts``.
     """
-    fields = sorted(message_type.fields, key=attrgetter("number"))
-    defaults = [field_default_ast(field, enum_registry) for field in fields]
-
     # Create a dict AST node resembling
-    #   {f0: f0_default, f1: f1_default, ..., **dict_comp}
-    # That is, a constant dictionary with each field ordered
-    # and mapped to its respective default value, and expanded
-    # at the end to include all filled message values
-    dict_comp_ast = ast.parse(
-        "{f.name: regname[f.full_name](v) for f, v in tmp.ListFields()}",
-        mode="eval",
-    ).body
-    dict_comp_ast.value.func.value.id = field_regname
-    dict_comp_ast.generators[0].iter.func.value.id = value_name
+    #   {f0: f0_cast(value.f0), f1: f1_default, ...}
+    # That is, a dictionary with each field ordered by number
+    # and mapped to either its value or its respective default value,
+    # the latter only when it's missing (i.e., not in ListFields)
+    fields = sorted(message_type.fields, key=attrgetter("number"))
     return ast.Dict(
-        keys=[ast.Constant(field.name) for field in fields] + [None],
-        values=defaults + [dict_comp_ast],
+        keys=[ast.Constant(field.name) for field in fields],
+        values=field_getter_asts(
+            fields=fields,
+            value_name=value_name,
+            enum_registry=enum_registry,
+            field_asts=field_asts,
+            field_value_name=field_value_name,
+        ),
+    )
+
+
+def message2record_ast(
+    message_type: Descriptor,
+    value_name: str,
+    enum_registry: dict[str, dict[int, str | None]],
+    field_asts: dict[str, ast.AST],
+    record_ast: ast.AST,
+    field_value_name: str = "value",
+) -> ast.AST:
+    """
+    AST to cast a ``value`` message to an instance of a record class,
+    like the ones from ``create_record_class``, whose fields are
+    positional arguments ordered by their number.
+
+    Parameters
+    ----------
+    message_type :
+        Concrete ``value.DESCRIPTOR`` object.
+    value_name :
+        Name of the ``value`` variable as seen in AST lexical scope.
+    enum_registry :
+        Registry of enums represented as "int to str" dictionaries.
+    field_asts :
+        Mapping of field full names to their "field to Python" cast
+        AST, which gets spliced in place of the field value.
+    record_ast :
+        AST of the record class, e.g. an item of the registry of record
+        classes from ``registry_item_ast``.
+    field_value_name :
+        Name of the field value variable in the ``field_asts``.
+    """
+    result_ast = ast.Call(
+        func=record_ast,
+        args=[],
+        keywords=[],
+    )
+    result_ast.args = field_getter_asts(
+        fields=sorted(message_type.fields, key=attrgetter("number")),
+        value_name=value_name,
+        enum_registry=enum_registry,
+        field_asts=field_asts,
+        field_value_name=field_value_name,
     )
+    return result_ast
+
+
+def field_getter_asts(
+    fields: list[FieldDescriptor],
+    value_name: str,
+    enum_registry: dict[str, dict[int, str | None]],
+    field_asts: dict[str, ast.AST],
+    field_value_name: str,
+) -> list[ast.AST]:
+    """ASTs to get the given fields from a ``value`` message."""
+    return [
+        field_getter_ast(
+            field=field,
+            value_name=value_name,
+            cast_ast=field_asts[field.full_name],
+            cast_value_name=field_value_name,
+            default_ast=field_default_ast(field, enum_registry),
+        )
+        for field in fields
+    ]
+
+
+def field_getter_ast(
+    field: FieldDescriptor,
+    value_name: str,
+    cast_ast: ast.AST,
+    cast_value_name: str,
+    default_ast: ast.AST,
+) -> ast.AST:
+    """
+    AST to get a field from a ``value`` message, splicing the field
+    access in the field ``cast_ast`` and using the ``default_ast``
+    when the field is missing.
+    """
+    attr_ast = ast.Attribute(
+        value=ast.Name(value_name, ctx=ast.Load()),
+        attr=field.name,
+        ctx=ast.Load(),
+    )
+    is_identity = is_identity_ast(cast_ast, cast_value_name)
+    spliced_ast = splice_ast(cast_ast, cast_value_name, attr_ast)
+
+    if field.has_presence:  # value.field if value.HasField(...) else None
+        has_field_ast = call_ast(
+            ast.Attribute(
+                value=ast.Name(value_name, ctx=ast.Load()),
+                attr="HasField",
+                ctx=ast.Load(),
+            ),
+            [ast.Constant(field.name)],
+        )
+        return ast.IfExp(test=has_field_ast, body=spliced_ast,
+                         orelse=default_ast)
+
+    # Empty containers should be replaced by their Python counterpart,
+    # there's nothing to do when the cast is a comprehension
+    if is_identity and LABEL_MAP[field.label] == "REPEATED":
+        return ast.BoolOp(op=ast.Or(), values=[spliced_ast, default_ast])
+
+    # Scalars and enums without presence are never missing
+    return spliced_ast
 
 
 def dict2message_ast(
     message_type: Descriptor,
     value_name: str,
-    constructors_regname: str,
-    field_regname: str,
+    constructor_ast: ast.AST,
+    field_asts: dict[str, ast.AST],
 ) -> ast.AST:
     """
     AST to cast a ``value`` Python dictionary to a protobuf message.
@@ -250,33 +534,55 @@ def dict2message_ast(
         Concrete ``value.DESCRIPTOR`` object.
     value_name :
         Name of the ``value`` variable as seen in AST lexical scope.
-    constructors_regname :
-        Name of the registry of protobuf message constructors as seen
-        in the AST lexical scope.
-    field_regname :
-        Name of the registry of "Python object to protobuf field"
-        converters as seen in the AST lexical scope.
-    """
-    # In the simplest form, it's just a constructors[message_name](**value)
-    message_name = repr(message_type.full_name)
-    python_code = f"{constructors_regname}[{message_name}](**{value_name})"
-    result_ast = ast.parse(python_code, mode="eval").body
-
-    # If a field needs conversion, all inputs need to be checked, and
-    # the **value keyword arguments should be a dict comprehension
-    if any(map(is_nesting_field, message_type.fields)):
-        dict_comp_ast = ast.parse(
-            "{k: nest_tmp for k, v in value_tmp.items()}",
-            mode="eval",
-        ).body  # *_tmp are replaced below, in order
-        dict_comp_ast.value = kv_call_ast(
-            message_type=message_type,
-            key_name="k",
-            value_name="v",
-            registry_name=field_regname,
+    constructor_ast :
+        AST of the protobuf message constructor, e.g. an item of the
+        registry of constructors from ``registry_item_ast``.
+    field_asts :
+        Mapping of field full names to their "Python object to protobuf
+        field" cast AST whose value variable is named ``value``,
+        only for the fields that require a cast.
+    """
+    # In the simplest form, it's just a constructor(**value)
+    result_ast = call_ast(
+        constructor_ast, [], {None: ast.Name(value_name, ctx=ast.Load())},
+    )
+
+    # If a field needs conversion, the **value keyword arguments should
+    # be a dict display overriding the fields to be cast, resembling
+    #   {**value, **({"f0": f0_cast(value["f0"])} if "f0" in value
+    #                else {}), ...}
+    # so that each field costs a single key check, instead of comparing
+    # every input key with the name of every field that needs a cast
+    if field_asts:
+        dict_ast = ast.Dict(
+            keys=[None],
+            values=[ast.Name(value_name, ctx=ast.Load())],
         )
-        dict_comp_ast.generators[0].iter.func.value.id = value_name
-        result_ast.keywords[0].value = dict_comp_ast
+        for field in message_type.fields:
+            if field.full_name in field_asts:
+                cast_ast = splice_ast(
+                    field_asts[field.full_name],
+                    "value",
+                    subscript_ast(
+                        ast.Name(value_name, ctx=ast.Load()),
+                        ast.Constant(field.name),
+                    ),
+                )
+                override_ast = ast.IfExp(  # {name: cast} if name in value
+                    test=ast.Compare(
+                        left=ast.Constant(field.name),
+                        ops=[ast.In()],
+                        comparators=[ast.Name(value_name, ctx=ast.Load())],
+                    ),
+                    body=ast.Dict(
+                        keys=[ast.Constant(field.name)],
+                        values=[cast_ast],
+                    ),
+                    orelse=ast.Dict(keys=[], values=[]),
+                )
+                dict_ast.keys.append(None)
+                dict_ast.values.append(override_ast)
+        result_ast.keywords[0].value = dict_ast
 
     return result_ast
 
@@ -297,21 +603,6 @@ def is_nesting_field(field: FieldDescriptor) -> bool:
     return False
 
 
-def kv_call_ast(
-    message_type: Descriptor,
-    key_name: str,
-    value_name: str,
-    registry_name: str,
-) -> ast.AST:
-    """
-    AST for ``registry[prefix + key](value)`` where ``prefix`` is the
-    full message name with a trailing dot.
-    """
-    prefix = message_type.full_name + "."
-    python_code = f"{registry_name}[{prefix!r} + {key_name}]({value_name})"
-    return ast.parse(python_code, mode="eval").body
-
-
 def wrap_call_ast(callable_name: str, input_ast: ast.AST) -> ast.AST:
     return ast.Call(
         func=ast.Name(callable_name, ctx=ast.Load()),
@@ -321,29 +612,28 @@ def wrap_call_ast(callable_name: str, input_ast: ast.AST) -> ast.AST:
 
 
 GOOGLE_PROTOBUF_WRAPPERS = {  # Message constructors registry for wrappers
-    f"google.protobuf.{pascal_name}": getattr(wrappers_pb2, pascal_name)
+    sys.intern(f"google.protobuf.{pascal_name}"):
+        getattr(wrappers_pb2, pascal_name)
     for upper_prefix in CPPTYPE_SCALARS + ("BYTES",)
     for pascal_name in [upper_prefix.title().replace("int", "Int") + "Value"]
 }
 
 
 def wrapper2message_ast(
-    full_name: str,
+    constructor_ast: ast.AST,
     value_name: str,
-    constructors_regname: str,
 ) -> ast.AST:
     """
     AST to cast ``value`` to a google protobuf wrapper message.
 
     Parameters
     ----------
-    full_name :
-        Full wrapper name, like ``google.protobuf.BoolValue``.
+    constructor_ast :
+        AST of the wrapper constructor, like ``google.protobuf.BoolValue``
+        from the registry of constructors.
     value_name :
         Name of the ``value`` variable as seen in AST lexical scope.
-    constructors_regname :
-        Name of the registry of protobuf message constructors as seen
-        in the AST lexical scope.
     """
-    python_code = f"{constructors_regname}[{full_name!r}](value={value_name})"
-    return ast.parse(python_code, mode="eval").body
+    return call_ast(
+        constructor_ast, [], {"value": ast.Name(value_name, ctx=ast.Load())},
+    )
@@ -1,9 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from threading import Barrier
+
+from google.protobuf import any_pb2, wrappers_pb2
 from google.protobuf.json_format import (
     MessageToDict as message_to_deserialized_json,
 )
 import grpc
+import pytest
+
+import dynagrpc
+from dynagrpc import (
+    AttrDict,
+    create_enum_dict,
+    create_enum_dicts,
+    DynaGrpcWarning,
+    GrpcTypeCastRegistry,
+    pascal2snake,
+)
 
-from dynagrpc import GrpcTypeCastRegistry
+
+@pytest.mark.parametrize("name,expected", [
+    ("Code", "code"),
+    ("I64Range", "i64_range"),
+    ("HTTPServer", "http_server"),
+    ("MyABC", "my_abc"),
+    ("AaBb", "aa_bb"),
+    ("myEnum", "enum"),
+    ("", ""),
+])
+def test_pascal2snake(name, expected):
+    assert pascal2snake(name) == expected
+
+
+def test_create_enum_dicts():
+    dummy_pb2 = grpc.protos("dummy.proto")
+    code_type = dummy_pb2.Code.DESCRIPTOR
+    shape_type = dummy_pb2.Shape.DESCRIPTOR
+
+    int2str, str2int = create_enum_dicts(code_type)
+    assert int2str == {
+        0: "UNSPECIFIED",
+        1: "ABSTRACT",
+        2: "CONCRETE",
+        3: "BOTH",
+        4: "INVALID",
+    }
+    assert str2int == {v: k for k, v in int2str.items()}
+    assert create_enum_dict(code_type, "int2str") == int2str
+    assert create_enum_dict(code_type, "str2int") == str2int
+    with pytest.raises(ValueError, match="'CODE_B' prefix"):
+        create_enum_dicts(code_type, "CODE_B")
+    with pytest.raises(ValueError, match="Unknown mode"):
+        create_enum_dict(code_type, "int2int")
+
+    with pytest.warns(DynaGrpcWarning, match="prefix in enum dummy.Shape"):
+        assert create_enum_dicts(shape_type) == (
+            {0: "NONE", 1: "CIRCLE"},
+            {"NONE": 0, "CIRCLE": 1},
+        )
+    assert create_enum_dicts(shape_type, "") == (
+        {0: "NONE", 1: "CIRCLE"},
+        {"NONE": 0, "CIRCLE": 1},
+    )
 
 
 def test_dummy_proto_astcast():
@@ -35,6 +94,7 @@ def test_dummy_proto_astcast():
     assert isinstance(proto_obj, dummy_pb2.Dummy)
     assert proto_obj.is_random is not True  # Wrapper behavior
     assert proto_obj.is_random.value is True
+    assert caster.proto2py(proto_obj.is_random) is True
     assert 3.1 < proto_obj.number < 3.2  # "optional" don't appear as wrapped
     codes_as_dict = dict(proto_obj.codes)  # Direct access use numbers for enum
     assert codes_as_dict == {"null": 0, "test": 2, "tree": 1, "grpc": 3}
@@ -48,3 +108,123 @@ def test_dummy_proto_astcast():
         "number": 3.14,
         "isRandom": True,
     }
+
+
+@pytest.mark.parametrize("dict_cls", [AttrDict, dict])
+@pytest.mark.parametrize("inline_max_nodes", [200, 0])
+def test_dummy_proto_nested_roundtrip(monkeypatch, inline_max_nodes, dict_cls):
+    monkeypatch.setattr(dynagrpc, "_INLINE_MAX_NODES", inline_max_nodes)
+    dummy_pb2 = grpc.protos("dummy.proto")
+
+    caster = GrpcTypeCastRegistry(dict_cls=dict_cls)
+    caster.register_enum_type(dummy_pb2.Code.DESCRIPTOR)
+    caster.register_message_type(dummy_pb2.Tree.DESCRIPTOR)
+
+    dict_data = {
+        "code": "BOTH",
+        "children": [
+            {"code": "ABSTRACT", "children": [{}], "range": {"end": 5}},
+            {"children": [{"code": "INVALID"}]},
+        ],
+    }
+    proto_obj = caster.py2proto(dummy_pb2.Tree, dict_data)
+
+    assert isinstance(proto_obj, dummy_pb2.Tree)
+    assert proto_obj.children[1].children[0].code == 4
+    assert caster.proto2py(proto_obj) == {
+        "code": "BOTH",
+        "children": [
+            {
+                "code": "ABSTRACT",
+                "children": [
+                    {"code": "UNSPECIFIED", "children": [], "range": None},
+                ],
+                "range": {"start": 0, "end": 5},
+            },
+            {
+                "code": "UNSPECIFIED",
+                "children": [
+                    {"code": "INVALID", "children": [], "range": None},
+                ],
+                "range": None,
+            },
+        ],
+        "range": None,
+    }
+    assert type(caster.proto2py(proto_obj)["children"][0]) is dict_cls
+    tree2py = caster.get_proto2py(dummy_pb2.Tree)
+    assert tree2py(proto_obj) == caster.proto2py(proto_obj)
+    assert caster.get_py2proto(dummy_pb2.Tree)(dict_data) == proto_obj
+
+
+def test_dummy_proto_records():
+    dummy_pb2 = grpc.protos("dummy.proto")
+
+    caster = GrpcTypeCastRegistry(dict_cls=None)
+    caster.register_enum_type(dummy_pb2.Code.DESCRIPTOR)
+    caster.register_message_type(dummy_pb2.Tree.DESCRIPTOR)
+
+    proto_obj = dummy_pb2.Tree(
+        code=dummy_pb2.CODE_BOTH,
+        children=[dummy_pb2.Tree(range=dummy_pb2.I64Range(start=-2))],
+    )
+    record = caster.proto2py(proto_obj)
+
+    assert not hasattr(record, "__dict__")
+    assert record.code == "BOTH"
+    assert record.range is None
+    child, = record.children
+    assert (child.code, child.children) == ("UNSPECIFIED", [])
+    assert repr(child.range) == "I64Range(start=-2, end=0)"
+
+    assert record == caster.proto2py(proto_obj)
+    assert record != caster.proto2py(dummy_pb2.Tree(code=dummy_pb2.CODE_BOTH))
+    assert record.children[0].range != {"start": -2, "end": 0}
+
+
+def test_google_protobuf_types():
+    caster = GrpcTypeCastRegistry()
+
+    assert caster.proto2py(wrappers_pb2.Int32Value(value=-3)) == -3
+    string_value = caster.py2proto(wrappers_pb2.StringValue, "text")
+    assert isinstance(string_value, wrappers_pb2.StringValue)
+    assert string_value.value == "text"
+    with pytest.raises(NotImplementedError, match="google.protobuf.Any"):
+        caster.proto2py(any_pb2.Any())
+
+
+def test_google_protobuf_types_threads():
+    wrapper_classes = [
+        getattr(wrappers_pb2, name) for name in dir(wrappers_pb2)
+        if name.endswith("Value")
+    ]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Races would happen in a few trials
+    try:
+        for unused in range(100):
+            caster = GrpcTypeCastRegistry()
+            barrier = Barrier(len(wrapper_classes))
+
+            def cast(wrapper_cls):
+                barrier.wait()
+                return caster.py2proto(wrapper_cls, wrapper_cls().value)
+
+            with ThreadPoolExecutor(len(wrapper_classes)) as executor:
+                results = list(executor.map(cast, wrapper_classes))
+            assert list(map(type, results)) == wrapper_classes
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_register_field_type():
+    dummy_pb2 = grpc.protos("dummy.proto")
+
+    caster = GrpcTypeCastRegistry()
+    caster.register_enum_type(dummy_pb2.Code.DESCRIPTOR)
+    caster.register_message_type(dummy_pb2.Tree.DESCRIPTOR)
+    assert not caster._namespace.f2p  # Message converters inline them
+
+    code_field = dummy_pb2.Tree.DESCRIPTOR.fields_by_name["code"]
+    caster.register_field_type(code_field)
+    p2f = caster._namespace.p2f["dummy.Tree.code"]
+    assert caster._namespace.f2p["dummy.Tree.code"](p2f("BOTH")) == "BOTH"